@@ -1,14 +1,17 @@
+from functools import partial
 from typing import Tuple
 
 import jax
 import jax.numpy as jnp
 
 from common import Batch, InfoDict, Model, Params, PRNGKey
-from common import expectile_loss as loss, get_deter, get_stoch
+from common import expectile_loss as loss, get_deter, get_scale, get_stoch
+from common import cast_to_bf16, lambda_returns, multistep_returns
 
 sg = lambda x: jax.lax.stop_gradient(x)
 
 
+@jax.jit
 def update_actor_bc(actor: Model, batch: Batch) -> Tuple[Model, InfoDict]:
 
     def actor_loss_fn(actor_params: Params) -> Tuple[jnp.ndarray, InfoDict]:
@@ -39,6 +42,7 @@ def update_alpha(
     return new_alpha, info
 
 
+@partial(jax.jit, static_argnames=("discount", "H", "expectile", "num_repeat"))
 def onestep_update_actor(
     key: PRNGKey,
     actor: Model,
@@ -52,38 +56,60 @@ def onestep_update_actor(
 ) -> Tuple[Model, InfoDict]:
 
     N = batch.observations.shape[0]
-    Robs = (
-        batch.observations[:, None, :]
-        .repeat(repeats=num_repeat, axis=1)
-        .reshape(N * num_repeat, -1)
-    )
-    Ra = get_deter(actor(Robs))
-
-    def calculate_gae_foward(Robs, Ra, key0):
-        states, rewards, actions, mask_weights, keys = [Robs], [], [Ra], [1.0], [key0]
-        for i in range(H):
-            rng1, rng2, rng3, key0 = jax.random.split(keys[-1], 4)
-            keys.append(key0)
-            s_next, rew, terminal, _ = model(rng1, states[i], actions[i])
-            a_next = get_deter(actor(s_next))
-            states.append(s_next)
-            actions.append(a_next)
-            rewards.append(rew)
-
-        states = jnp.stack(states, axis=0)
-        actions = jnp.stack(actions, axis=0)
-        mask_weights = jnp.stack(mask_weights, axis=0)
+    ## The rollout is inference-only, so run it in bfloat16; the loss below
+    ## differentiates through float32 copies of the trajectory.
+    bf16_actor = actor.replace(params=cast_to_bf16(actor.params))
+    bf16_model = model.replace(params=cast_to_bf16(model.params))
+    obs = batch.observations.astype(jnp.bfloat16)
+    Ra = get_deter(bf16_actor(obs))
+
+    def calculate_gae_foward(Robs, Ra, idx):
+        ## Derive the per-sample key inside the vmap instead of materializing
+        ## an (N * num_repeat, 2) split beforehand
+        key0 = jax.random.fold_in(key, idx)
+        ## H is static under jit, so this branch specializes the compiled
+        ## artifact: the common H=1 case gets a single fused step, no scan
+        if H == 1:
+            s_next, rew, terminal, _ = bf16_model(key0, Robs, Ra)
+            s_next = s_next.astype(jnp.bfloat16)
+            a_next = get_deter(bf16_actor(s_next))
+            states = jnp.stack([Robs, s_next], axis=0)
+            actions = jnp.stack([Ra, a_next], axis=0)
+            mask_weights = jnp.ones(1)
+            return states, actions, mask_weights
+
+        def step(carry, rng):
+            s, a = carry
+            s_next, rew, terminal, _ = bf16_model(rng, s, a)
+            s_next = s_next.astype(jnp.bfloat16)
+            a_next = get_deter(bf16_actor(s_next))
+            return (s_next, a_next), (s_next, a_next)
+
+        step_keys = jax.random.split(key0, H)
+        _, (next_states, next_actions) = jax.lax.scan(step, (Robs, Ra), step_keys)
+
+        states = jnp.concatenate([Robs[None], next_states], axis=0)
+        actions = jnp.concatenate([Ra[None], next_actions], axis=0)
+        mask_weights = jnp.ones(1)
         return states, actions, mask_weights
 
-    keys = jax.random.split(key, N * num_repeat)
-    vmap_foward = lambda func: jax.vmap(func, in_axes=0, out_axes=1)
-    states0, actions0, mask_weights0 = vmap_foward(calculate_gae_foward)(Robs, Ra, keys)
+    ## vmap over the repeat axis broadcasts obs/Ra instead of tiling them
+    idxs = jnp.arange(N * num_repeat).reshape(N, num_repeat)
+    vmap_foward = lambda func: jax.vmap(
+        jax.vmap(func, in_axes=(None, None, 0)), in_axes=(0, 0, 0)
+    )
+    states0, actions0, mask_weights0 = vmap_foward(calculate_gae_foward)(obs, Ra, idxs)
+    states0 = states0.reshape(N * num_repeat, H + 1, -1).astype(jnp.float32)
+    actions0 = actions0.reshape(N * num_repeat, H + 1, -1).astype(jnp.float32)
+    mask_weights0 = mask_weights0.reshape(N * num_repeat, -1)
 
     def actor_loss_fn(actor_params: Params) -> Tuple[jnp.ndarray, InfoDict]:
-        dist = actor.apply({"params": actor_params}, states0)
+        ## The rollout states are constants w.r.t. actor_params; mark them
+        ## explicitly so the backward pass drops all state-side activations
+        dist = actor.apply({"params": actor_params}, sg(states0))
         actions = get_deter(dist)
-        actor_loss = -(mask_weights0 * critic(states0, actions)).mean()
-        policy_std = dist.scale if hasattr(dist, "scale") else dist.distribution.scale
+        actor_loss = -(mask_weights0 * critic(sg(states0), actions)).mean()
+        policy_std = get_scale(dist)
 
         return actor_loss, {
             "actor_loss": actor_loss,
@@ -96,6 +122,9 @@ def onestep_update_actor(
     return new_actor, info
 
 
+@partial(
+    jax.jit, static_argnames=("discount", "lamb", "H", "expectile", "num_repeat")
+)
 def DPG_lambda_update_actor(
     key: PRNGKey,
     actor: Model,
@@ -110,122 +139,102 @@ def DPG_lambda_update_actor(
 ) -> Tuple[Model, InfoDict]:
 
     N = batch.observations.shape[0]
-    Robs = (
-        batch.observations[:, None, :]
-        .repeat(repeats=num_repeat, axis=1)
-        .reshape(N * num_repeat, -1)
-    )
-    Ra = get_deter(actor(Robs))
-
-    def calculate_gae_foward(Robs, Ra, key0):
-        ## Generate imagined trajectory
-        states, rewards, actions, mask_weights, keys = [Robs], [], [Ra], [1.0], [key0]
-        q_rollout, q_values, ep_weights = [], [critic(Robs, Ra)], []
-        for i in range(H):
-            rng1, rng2, rng3, key0 = jax.random.split(keys[-1], 4)
-            keys.append(key0)
-            s_next, rew, terminal, _ = model(rng1, states[i], actions[i])
-            a_next = get_deter(actor(s_next))
-            states.append(s_next)
-            actions.append(a_next)
-            rewards.append(rew)
-            mask_weights.append(mask_weights[i] * (1 - terminal))
-            q_values.append(critic(s_next, a_next))
+    obs = batch.observations
+    Ra = get_deter(actor(obs))
+
+    def calculate_gae_rollout(delta_a, Robs, Ra, key0):
+        ## Generate imagined trajectory, perturbing the action at every step
+        a0 = Ra + delta_a[0]
+
+        def step(carry, xs):
+            rng, delta = xs
+            s, a, mask = carry
+            s_next, rew, terminal, _ = model(rng, s, a)
+            a_next = get_deter(actor(s_next)) + delta
+            mask_next = mask * (1 - terminal)
+            return (s_next, a_next, mask_next), (s_next, a_next, rew, mask_next)
+
+        ## Rematerialize the step during differentiation so peak memory stays
+        ## bounded for large H instead of keeping every step's activations live
+        step = jax.checkpoint(
+            step, policy=jax.checkpoint_policies.dots_with_no_batch_dims_saveable
+        )
+        step_keys = jax.random.split(key0, H)
+        _, (next_states, next_actions, rewards, next_masks) = jax.lax.scan(
+            step, (Robs, a0, jnp.float32(1.0)), (step_keys, delta_a[1:])
+        )
+
+        states = jnp.concatenate([Robs[None], next_states], axis=0)
+        actions = jnp.concatenate([a0[None], next_actions], axis=0)
+        mask_weights = jnp.concatenate([jnp.ones(1), next_masks], axis=0)
+        ## Single (H+1)-row critic evaluation instead of H+1 per-step calls
+        q_values = critic(states, actions)
 
         ## Calculate lambda-returns
-        q_rollout, lamb_weight = [q_values[-1]], 1.0
-        for i in reversed(range(H)):
-            q_next = (
-                mask_weights[i] * rewards[i]
-                + mask_weights[i + 1] * discount * q_rollout[-1]
-            )
-            next_value = (q_values[i] + lamb * lamb_weight * q_next) / (
-                1 + lamb * lamb_weight
-            )
-            q_rollout.append(next_value)
-            lamb_weight = 1.0 + lamb * lamb_weight
-        q_rollout = list(reversed(q_rollout))
+        q_rollout = lambda_returns(q_values, rewards, mask_weights, discount, lamb)
+        return states, actions, mask_weights, q_values, q_rollout
+
+    adim = batch.actions.shape[-1]
+    delta_a = jnp.zeros((H + 1, adim))
+    basis = jnp.eye((H + 1) * adim).reshape(-1, H + 1, adim)
+
+    def rollout_with_grads(Robs, Ra, idx):
+        ## Derive the per-sample key inside the vmap instead of materializing
+        ## an (N * num_repeat, 2) split beforehand
+        key0 = jax.random.fold_in(key, idx)
+        ## One primal rollout shared between the forward pass and the
+        ## forward-mode JVPs that give the gradient of Q_t^{\lambda} w.r.t a_t
+        primals, f_jvp = jax.linearize(
+            lambda delta: calculate_gae_rollout(delta, Robs, Ra, key0), delta_a
+        )
+        states, actions, mask_weights, q_values, q_rollout = primals
+
+        ## Each basis tangent only contributes to its own timestep, so gather
+        ## that entry inside the vmap instead of materializing the full
+        ## (H+1)*adim x (H+1) tangent block and slicing its diagonal
+        t_idx = jnp.repeat(jnp.arange(H + 1), adim)
+        grad_gae = jax.vmap(lambda t, tangent: f_jvp(tangent)[-1][t])(t_idx, basis)
+        grad_gae = grad_gae.reshape(H + 1, adim)
 
         ## Calculate asymmetric weights
-        ep_weights = []
-        for i in range(H):
-            ep_weights.append(
-                jnp.where(q_rollout[i] > q_values[i], expectile, 1 - expectile)
-            )
-        ep_weights.append(0.5)
-
-        states = jnp.stack(states, axis=0)
-        actions = jnp.stack(actions, axis=0)
-        mask_weights = jnp.stack(mask_weights, axis=0)
-        q_rollout = jnp.stack(q_rollout, axis=0)
-        ep_weights = jnp.stack(ep_weights, axis=0)
-        return states, actions, mask_weights, q_rollout, ep_weights
-
-    keys = jax.random.split(key, N * num_repeat)
-    vmap_foward = lambda func: jax.vmap(func, in_axes=0, out_axes=1)
-    states0, actions0, mask_weights0, q_rollout, ep_weights = vmap_foward(
-        calculate_gae_foward
-    )(Robs, Ra, keys)
-
-    def calculate_gae_backward(delta_a, Robs, Ra, key0):
-        ## Generate imagined trajectory (identical with foward)
-        states, rewards, actions, mask_weights, keys = (
-            [Robs],
-            [],
-            [Ra + delta_a[0]],
-            [1.0],
-            [key0],
+        ep_weights = jnp.where(
+            q_rollout[:-1] > q_values[:-1], expectile, 1 - expectile
         )
-        q_rollout, q_values, ep_weights = [], [critic(Robs, Ra + delta_a[0])], []
-        for i in range(H):
-            rng1, rng2, rng3, key0 = jax.random.split(keys[-1], 4)
-            keys.append(key0)
-            s_next, rew, terminal, _ = model(rng1, states[i], actions[i])
-            a_next = get_deter(actor(s_next)) + delta_a[i + 1]
-            states.append(s_next)
-            actions.append(a_next)
-            rewards.append(rew)
-            mask_weights.append(mask_weights[i] * (1 - terminal))
-            q_values.append(critic(s_next, a_next))
+        ep_weights = jnp.concatenate([ep_weights, jnp.full((1,), 0.5)], axis=0)
 
-        ## Calculate lambda-returns
-        q_rollout, lamb_weight = [q_values[-1]], 1.0
-        for i in reversed(range(H)):
-            q_next = (
-                mask_weights[i] * rewards[i]
-                + mask_weights[i + 1] * discount * q_rollout[-1]
-            )
-            next_value = (q_values[i] + lamb * lamb_weight * q_next) / (
-                1 + lamb * lamb_weight
-            )
-            q_rollout.append(next_value)
-            lamb_weight = 1.0 + lamb * lamb_weight
-        q_rollout = list(reversed(q_rollout))
-
-        return jnp.stack(q_rollout, axis=0)
-
-    ## Calculate gradient of Q_t^{\lambda} w.r.t a_t
-    delta_a = jnp.zeros_like(actions0)
-    vmap_backward = lambda func: jax.vmap(func, in_axes=(1, 0, 0, 0), out_axes=1)
-    grad_gae = vmap_backward(jax.jacrev(calculate_gae_backward))(
-        delta_a, Robs, Ra, keys
+        return states, actions, mask_weights, q_rollout, ep_weights, grad_gae
+
+    ## vmap over the repeat axis broadcasts obs/Ra instead of tiling them
+    idxs = jnp.arange(N * num_repeat).reshape(N, num_repeat)
+    vmap_rollout = lambda func: jax.vmap(
+        jax.vmap(func, in_axes=(None, None, 0)), in_axes=(0, 0, 0)
     )
-    grad_gae = jnp.stack([grad_gae[i, :, i] for i in range(H + 1)])
+    states0, actions0, mask_weights0, q_rollout, ep_weights, grad_gae = vmap_rollout(
+        rollout_with_grads
+    )(obs, Ra, idxs)
+    states0 = states0.reshape(N * num_repeat, H + 1, -1)
+    actions0 = actions0.reshape(N * num_repeat, H + 1, -1)
+    mask_weights0 = mask_weights0.reshape(N * num_repeat, H + 1)
+    q_rollout = q_rollout.reshape(N * num_repeat, H + 1)
+    ep_weights = ep_weights.reshape(N * num_repeat, H + 1)
+    grad_gae = grad_gae.reshape(N * num_repeat, H + 1, adim)
 
     def actor_loss_fn(actor_params: Params) -> Tuple[jnp.ndarray, InfoDict]:
-        dist = actor.apply({"params": actor_params}, states0, 1.0, training=True)
-        actions_grad = get_deter(dist)
-        policy_std = dist.scale if hasattr(dist, "scale") else dist.distribution.scale
+        ## Flatten (batch, time) so the actor MLP runs one large GEMM
+        flat_states = states0.reshape(-1, states0.shape[-1])
+        dist = actor.apply({"params": actor_params}, flat_states, 1.0, training=True)
+        actions_grad = get_deter(dist).reshape(states0.shape[:-1] + (-1,))
+        policy_std = get_scale(dist)
 
         ## Calculate gradient of Q_t^{\lambda} w.r.t parameter using deterministic policy gradient theorem (chain rule)
         actor_loss = (
-            -(ep_weights[:, :, None] * grad_gae * actions_grad).mean(axis=1).sum()
+            -(ep_weights[:, :, None] * grad_gae * actions_grad).mean(axis=0).sum()
         )
         return actor_loss, {
             "actor_loss": actor_loss,
             "q_rollout": q_rollout.mean(),
             "lambda_actor": lamb,
-            "policy_std": (policy_std * mask_weights0[:, :, None]).mean()
+            "policy_std": (policy_std * mask_weights0.reshape(-1, 1)).mean()
             / mask_weights0.mean(),
             "adv_weights": (ep_weights * mask_weights0).mean() / mask_weights0.mean(),
             "abs_actions": jnp.abs(actions0).mean(),
@@ -235,6 +244,7 @@ def DPG_lambda_update_actor(
     return new_actor, info
 
 
+@partial(jax.jit, static_argnames=("discount", "H", "expectile", "num_repeat"))
 def DPG_multistep_update_actor(
     key: PRNGKey,
     actor: Model,
@@ -248,113 +258,101 @@ def DPG_multistep_update_actor(
 ) -> Tuple[Model, InfoDict]:
 
     N = batch.observations.shape[0]
-    Robs = (
-        batch.observations[:, None, :]
-        .repeat(repeats=num_repeat, axis=1)
-        .reshape(N * num_repeat, -1)
-    )
-    Ra = get_deter(actor(Robs))
-
-    def calculate_gae_foward(Robs, Ra, key0):
-        ## Generate imagined trajectory (identical with foward)
-        states, rewards, actions, mask_weights, keys = [Robs], [], [Ra], [1.0], [key0]
-        q_rollout, q_values, ep_weights = [], [critic(Robs, Ra)], []
-        for i in range(H):
-            rng1, rng2, rng3, key0 = jax.random.split(keys[-1], 4)
-            keys.append(key0)
-            s_next, rew, terminal, _ = model(rng1, states[i], actions[i])
-            a_next = get_deter(actor(s_next))
-            states.append(s_next)
-            actions.append(a_next)
-            rewards.append(rew)
-            mask_weights.append(mask_weights[i] * (1 - terminal))
-            q_values.append(critic(s_next, a_next))
+    obs = batch.observations
+    Ra = get_deter(actor(obs))
+
+    def calculate_gae_rollout(delta_a, Robs, Ra, key0):
+        ## Generate imagined trajectory, perturbing the action at every step
+        a0 = Ra + delta_a[0]
+
+        def step(carry, xs):
+            rng, delta = xs
+            s, a, mask = carry
+            s_next, rew, terminal, _ = model(rng, s, a)
+            a_next = get_deter(actor(s_next)) + delta
+            mask_next = mask * (1 - terminal)
+            return (s_next, a_next, mask_next), (s_next, a_next, rew, mask_next)
+
+        ## Rematerialize the step during differentiation so peak memory stays
+        ## bounded for large H instead of keeping every step's activations live
+        step = jax.checkpoint(
+            step, policy=jax.checkpoint_policies.dots_with_no_batch_dims_saveable
+        )
+        step_keys = jax.random.split(key0, H)
+        _, (next_states, next_actions, rewards, next_masks) = jax.lax.scan(
+            step, (Robs, a0, jnp.float32(1.0)), (step_keys, delta_a[1:])
+        )
+
+        states = jnp.concatenate([Robs[None], next_states], axis=0)
+        actions = jnp.concatenate([a0[None], next_actions], axis=0)
+        mask_weights = jnp.concatenate([jnp.ones(1), next_masks], axis=0)
+        ## Single (H+1)-row critic evaluation instead of H+1 per-step calls
+        q_values = critic(states, actions)
 
         ## Calculate multi-step returns
-        q_rollout, lamb_weight = [q_values[-1]], 1.0
-        for i in reversed(range(H)):
-            q_next = (
-                mask_weights[i] * rewards[i]
-                + mask_weights[i + 1] * discount * q_rollout[-1]
-            )
-            q_rollout.append(q_next)
-        q_rollout = list(reversed(q_rollout))
+        q_rollout = multistep_returns(q_values, rewards, mask_weights, discount)
+        return states, actions, mask_weights, q_values, q_rollout
+
+    adim = batch.actions.shape[-1]
+    delta_a = jnp.zeros((H + 1, adim))
+    basis = jnp.eye((H + 1) * adim).reshape(-1, H + 1, adim)
+
+    def rollout_with_grads(Robs, Ra, idx):
+        ## Derive the per-sample key inside the vmap instead of materializing
+        ## an (N * num_repeat, 2) split beforehand
+        key0 = jax.random.fold_in(key, idx)
+        ## One primal rollout shared between the forward pass and the
+        ## forward-mode JVPs that give the gradient of Q_t^H w.r.t a_t
+        primals, f_jvp = jax.linearize(
+            lambda delta: calculate_gae_rollout(delta, Robs, Ra, key0), delta_a
+        )
+        states, actions, mask_weights, q_values, q_rollout = primals
+
+        ## Each basis tangent only contributes to its own timestep, so gather
+        ## that entry inside the vmap instead of materializing the full
+        ## (H+1)*adim x (H+1) tangent block and slicing its diagonal
+        t_idx = jnp.repeat(jnp.arange(H + 1), adim)
+        grad_gae = jax.vmap(lambda t, tangent: f_jvp(tangent)[-1][t])(t_idx, basis)
+        grad_gae = grad_gae.reshape(H + 1, adim)
 
         ## Calculate asymmetric weights
-        ep_weights = []
-        for i in range(H):
-            ep_weights.append(
-                jnp.where(q_rollout[i] > q_values[i], expectile, 1 - expectile)
-            )
-        ep_weights.append(0.5)
-
-        states = jnp.stack(states, axis=0)
-        actions = jnp.stack(actions, axis=0)
-        mask_weights = jnp.stack(mask_weights, axis=0)
-        q_rollout = jnp.stack(q_rollout, axis=0)
-        ep_weights = jnp.stack(ep_weights, axis=0)
-        return states, actions, mask_weights, q_rollout, ep_weights
-
-    keys = jax.random.split(key, N * num_repeat)
-    vmap_foward = lambda func: jax.vmap(func, in_axes=0, out_axes=1)
-    states0, actions0, mask_weights0, q_rollout, ep_weights = vmap_foward(
-        calculate_gae_foward
-    )(Robs, Ra, keys)
-
-    def calculate_gae_backward(delta_a, Robs, Ra, key0):
-        ## Generate imagined trajectory (identical with foward)
-        states, rewards, actions, mask_weights, keys = (
-            [Robs],
-            [],
-            [Ra + delta_a[0]],
-            [1.0],
-            [key0],
+        ep_weights = jnp.where(
+            q_rollout[:-1] > q_values[:-1], expectile, 1 - expectile
         )
-        q_rollout, q_values, ep_weights = [], [critic(Robs, Ra + delta_a[0])], []
-        for i in range(H):
-            rng1, rng2, rng3, key0 = jax.random.split(keys[-1], 4)
-            keys.append(key0)
-            s_next, rew, terminal, _ = model(rng1, states[i], actions[i])
-            a_next = get_deter(actor(s_next)) + delta_a[i + 1]
-            states.append(s_next)
-            actions.append(a_next)
-            rewards.append(rew)
-            mask_weights.append(mask_weights[i] * (1 - terminal))
-            q_values.append(critic(s_next, a_next))
+        ep_weights = jnp.concatenate([ep_weights, jnp.full((1,), 0.5)], axis=0)
 
-        ## Calculate multi-step returns
-        q_rollout, lamb_weight = [q_values[-1]], 1.0
-        for i in reversed(range(H)):
-            q_next = (
-                mask_weights[i] * rewards[i]
-                + mask_weights[i + 1] * discount * q_rollout[-1]
-            )
-            q_rollout.append(q_next)
-        q_rollout = list(reversed(q_rollout))
-
-        return jnp.stack(q_rollout, axis=0)
-
-    ## Calculate gradient of Q_t^H w.r.t a_t
-    delta_a = jnp.zeros_like(actions0)
-    vmap_backward = lambda func: jax.vmap(func, in_axes=(1, 0, 0, 0), out_axes=1)
-    grad_gae = vmap_backward(jax.jacrev(calculate_gae_backward))(
-        delta_a, Robs, Ra, keys
+        return states, actions, mask_weights, q_rollout, ep_weights, grad_gae
+
+    ## vmap over the repeat axis broadcasts obs/Ra instead of tiling them
+    idxs = jnp.arange(N * num_repeat).reshape(N, num_repeat)
+    vmap_rollout = lambda func: jax.vmap(
+        jax.vmap(func, in_axes=(None, None, 0)), in_axes=(0, 0, 0)
     )
-    grad_gae = jnp.stack([grad_gae[i, :, i] for i in range(H + 1)])
+    states0, actions0, mask_weights0, q_rollout, ep_weights, grad_gae = vmap_rollout(
+        rollout_with_grads
+    )(obs, Ra, idxs)
+    states0 = states0.reshape(N * num_repeat, H + 1, -1)
+    actions0 = actions0.reshape(N * num_repeat, H + 1, -1)
+    mask_weights0 = mask_weights0.reshape(N * num_repeat, H + 1)
+    q_rollout = q_rollout.reshape(N * num_repeat, H + 1)
+    ep_weights = ep_weights.reshape(N * num_repeat, H + 1)
+    grad_gae = grad_gae.reshape(N * num_repeat, H + 1, adim)
 
     def actor_loss_fn(actor_params: Params) -> Tuple[jnp.ndarray, InfoDict]:
-        dist = actor.apply({"params": actor_params}, states0, 1.0, training=True)
-        actions_grad = get_deter(dist)
-        policy_std = dist.scale if hasattr(dist, "scale") else dist.distribution.scale
+        ## Flatten (batch, time) so the actor MLP runs one large GEMM
+        flat_states = states0.reshape(-1, states0.shape[-1])
+        dist = actor.apply({"params": actor_params}, flat_states, 1.0, training=True)
+        actions_grad = get_deter(dist).reshape(states0.shape[:-1] + (-1,))
+        policy_std = get_scale(dist)
         ## Calculate gradient of Q_t^H w.r.t parameter using deterministic policy gradient theorem (chain rule)
         actor_loss = (
-            -(ep_weights[:, :, None] * grad_gae * actions_grad).mean(axis=1).sum()
+            -(ep_weights[:, :, None] * grad_gae * actions_grad).mean(axis=0).sum()
         )
 
         return actor_loss, {
             "actor_loss": actor_loss,
             "q_rollout": q_rollout.mean(),
-            "policy_std": (policy_std * mask_weights0[:, :, None]).mean()
+            "policy_std": (policy_std * mask_weights0.reshape(-1, 1)).mean()
             / mask_weights0.mean(),
             "adv_weights": (ep_weights * mask_weights0).mean() / mask_weights0.mean(),
             "abs_actions": jnp.abs(actions0).mean(),
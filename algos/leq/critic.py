@@ -5,7 +5,8 @@ import jax
 
 import numpy as np
 from common import Batch, InfoDict, Model, Params, PRNGKey
-from common import expectile_loss as loss, get_deter
+from common import expectile_loss as loss, cast_to_bf16, get_deter
+from common import lambda_returns, multistep_returns
 
 
 def update_q_fqe(
@@ -55,47 +56,49 @@ def onestep_update_q(
     N = model_batch.observations.shape[0]
     key1, key2, key3, key4 = jax.random.split(key, 4)
 
-    ## Generate imaginary trajectories
+    ## Generate imaginary trajectories (inference-only, so roll out in bfloat16)
+    bf16_actor = actor.replace(params=cast_to_bf16(actor.params))
+    bf16_model = model.replace(params=cast_to_bf16(model.params))
     Robs = (
         model_batch.observations[:, None, :]
         .repeat(repeats=num_repeat, axis=1)
         .reshape(N * num_repeat, -1)
+    ).astype(jnp.bfloat16)
+    Ra = get_deter(bf16_actor(Robs, 0.0))
+    def rollout_step(carry, _):
+        s, a, mask_weight, loss_weight, key = carry
+        rng2, key = jax.random.split(key)
+        s_next, rew, terminal, _ = bf16_model(rng2, s, jnp.clip(a, -1.0, 1.0))
+        s_next = s_next.astype(jnp.bfloat16)
+        a_next = get_deter(bf16_actor(s_next, 0.0))
+        mask = 1 - terminal
+        mask_weight_next = mask_weight * mask
+        return (s_next, a_next, mask_weight_next, loss_weight * mask * discount, key), (
+            s_next,
+            a_next,
+            rew,
+            mask,
+            mask_weight_next,
+            loss_weight,
+        )
+
+    init = (Robs, Ra, jnp.ones(N * num_repeat), jnp.ones(N * num_repeat), key1)
+    _, (next_states, next_actions, rewards, masks, next_mask_weights, loss_weights) = (
+        jax.lax.scan(rollout_step, init, None, length=H)
     )
-    Ra = get_deter(actor(Robs, 0.0))
-    states, rewards, actions, masks, mask_weights, loss_weights = (
-        [Robs],
-        [],
-        [Ra],
-        [],
-        [jnp.ones(N * num_repeat)],
-        [jnp.ones(N * num_repeat)],
+
+    states = jnp.concatenate([Robs[None], next_states], axis=0)
+    actions = jnp.concatenate([Ra[None], next_actions], axis=0)
+    mask_weights = jnp.concatenate(
+        [jnp.ones((1, N * num_repeat)), next_mask_weights], axis=0
     )
-    for i in range(H):
-        s, a = states[-1], actions[-1]
-        rng1, rng2, key1 = jax.random.split(key1, 3)
-        s_next, rew, terminal, _ = model(rng2, s, jnp.clip(a, -1.0, 1.0))
-        a_next = get_deter(actor(s_next, 0.0))
-        states.append(s_next)
-        actions.append(a_next)
-        rewards.append(rew)
-        masks.append(1 - terminal)
-        mask_weights.append(mask_weights[i] * (1 - terminal))
-        loss_weights.append(loss_weights[i] * (1 - terminal) * discount)
-
-    mask_weights = jnp.stack(mask_weights, axis=0)
-    loss_weights = jnp.stack(loss_weights[:-1], axis=0)
 
     ## Calculate one-step returns
-    target_q_rollout = []
-    for i in range(H):
-        target_q_rollout.append(
-            rewards[i] + masks[i] * discount * critic(states[i + 1], actions[i + 1])
-        )
+    target_q_rollout = rewards + masks * discount * critic(states[1:], actions[1:])
 
-    target_q_rollout = jnp.stack(target_q_rollout, axis=0)
-    states = jnp.stack(states[:-1], axis=0)
-    actions = jnp.stack(actions[:-1], axis=0)
-    rewards = jnp.stack(rewards, axis=0)
+    ## Back to float32 for the critic losses
+    states = states[:-1].astype(jnp.float32)
+    actions = actions[:-1].astype(jnp.float32)
 
     ## Calculate target for dataset transitions
     next_a = get_deter(actor(data_batch.next_observations, 0.0))
@@ -179,51 +182,50 @@ def multistep_update_q(
     N = model_batch.observations.shape[0]
     key1, key2, key3, key4 = jax.random.split(key, 4)
 
-    ## Generate imaginary trajectories
+    ## Generate imaginary trajectories (inference-only, so roll out in bfloat16)
+    bf16_actor = actor.replace(params=cast_to_bf16(actor.params))
+    bf16_model = model.replace(params=cast_to_bf16(model.params))
     Robs = (
         model_batch.observations[:, None, :]
         .repeat(repeats=num_repeat, axis=1)
         .reshape(N * num_repeat, -1)
+    ).astype(jnp.bfloat16)
+    Ra = get_deter(bf16_actor(Robs, 0.0))
+    def rollout_step(carry, _):
+        s, a, mask_weight, loss_weight, key = carry
+        rng2, key = jax.random.split(key)
+        s_next, rew, terminal, _ = bf16_model(rng2, s, jnp.clip(a, -1.0, 1.0))
+        s_next = s_next.astype(jnp.bfloat16)
+        a_next = get_deter(bf16_actor(s_next, 0.0))
+        mask = 1 - terminal
+        mask_weight_next = mask_weight * mask
+        return (s_next, a_next, mask_weight_next, loss_weight * mask * discount, key), (
+            s_next,
+            a_next,
+            rew,
+            mask,
+            mask_weight_next,
+            loss_weight,
+        )
+
+    init = (Robs, Ra, jnp.ones(N * num_repeat), jnp.ones(N * num_repeat), key1)
+    _, (next_states, next_actions, rewards, masks, next_mask_weights, loss_weights) = (
+        jax.lax.scan(rollout_step, init, None, length=H)
     )
-    Ra = get_deter(actor(Robs, 0.0))
-    states, rewards, actions, masks, mask_weights, loss_weights = (
-        [Robs],
-        [],
-        [Ra],
-        [],
-        [jnp.ones(N * num_repeat)],
-        [jnp.ones(N * num_repeat)],
+
+    states = jnp.concatenate([Robs[None], next_states], axis=0)
+    actions = jnp.concatenate([Ra[None], next_actions], axis=0)
+    mask_weights = jnp.concatenate(
+        [jnp.ones((1, N * num_repeat)), next_mask_weights], axis=0
     )
-    for i in range(H):
-        s, a = states[-1], actions[-1]
-        rng1, rng2, key1 = jax.random.split(key1, 3)
-        s_next, rew, terminal, _ = model(rng2, s, jnp.clip(a, -1.0, 1.0))
-        a_next = get_deter(actor(s_next, 0.0))
-        states.append(s_next)
-        actions.append(a_next)
-        rewards.append(rew)
-        masks.append(1 - terminal)
-        mask_weights.append(mask_weights[i] * (1 - terminal))
-        loss_weights.append(loss_weights[i] * (1 - terminal) * discount)
-
-    mask_weights = jnp.stack(mask_weights, axis=0)
-    loss_weights = jnp.stack(loss_weights[:-1], axis=0)
 
     ## Calculate multi-step returns
-    target_q_rollout = [critic(states[-1], actions[-1])]
-    for i in reversed(range(H)):
-        q_cur = critic(states[i], actions[i])
-        q_next = (
-            mask_weights[i] * rewards[i]
-            + mask_weights[i + 1] * discount * target_q_rollout[-1]
-        )
-        target_q_rollout.append(q_next)
-    target_q_rollout = list(reversed(target_q_rollout))[:-1]
+    q_values = critic(states, actions)
+    target_q_rollout = multistep_returns(q_values, rewards, mask_weights, discount)[:-1]
 
-    target_q_rollout = jnp.stack(target_q_rollout, axis=0)
-    states = jnp.stack(states[:-1], axis=0)
-    actions = jnp.stack(actions[:-1], axis=0)
-    rewards = jnp.stack(rewards, axis=0)
+    ## Back to float32 for the critic losses
+    states = states[:-1].astype(jnp.float32)
+    actions = actions[:-1].astype(jnp.float32)
 
     ## Calculate target for dataset transitions
     next_a = get_deter(actor(data_batch.next_observations, 0.0))
@@ -308,53 +310,52 @@ def lambda_update_q(
     N = model_batch.observations.shape[0]
     key1, key2, key3, key4 = jax.random.split(key, 4)
 
-    ## Generate imaginary trajectories
+    ## Generate imaginary trajectories (inference-only, so roll out in bfloat16)
+    bf16_actor = actor.replace(params=cast_to_bf16(actor.params))
+    bf16_model = model.replace(params=cast_to_bf16(model.params))
     Robs = (
         model_batch.observations[:, None, :]
         .repeat(repeats=num_repeat, axis=1)
         .reshape(N * num_repeat, -1)
+    ).astype(jnp.bfloat16)
+    Ra = get_deter(bf16_actor(Robs, 0.0))
+    def rollout_step(carry, _):
+        s, a, mask_weight, loss_weight, key = carry
+        rng2, key = jax.random.split(key)
+        s_next, rew, terminal, _ = bf16_model(rng2, s, jnp.clip(a, -1.0, 1.0))
+        s_next = s_next.astype(jnp.bfloat16)
+        a_next = get_deter(bf16_actor(s_next, 0.0))
+        mask = 1 - terminal
+        mask_weight_next = mask_weight * mask
+        return (s_next, a_next, mask_weight_next, loss_weight * mask * discount, key), (
+            s_next,
+            a_next,
+            rew,
+            mask,
+            mask_weight_next,
+            loss_weight,
+        )
+
+    init = (Robs, Ra, jnp.ones(N * num_repeat), jnp.ones(N * num_repeat), key1)
+    _, (next_states, next_actions, rewards, masks, next_mask_weights, loss_weights) = (
+        jax.lax.scan(rollout_step, init, None, length=H)
     )
-    Ra = get_deter(actor(Robs, 0.0))
-    states, rewards, actions, masks, mask_weights, loss_weights = (
-        [Robs],
-        [],
-        [Ra],
-        [],
-        [jnp.ones(N * num_repeat)],
-        [jnp.ones(N * num_repeat)],
+
+    states = jnp.concatenate([Robs[None], next_states], axis=0)
+    actions = jnp.concatenate([Ra[None], next_actions], axis=0)
+    mask_weights = jnp.concatenate(
+        [jnp.ones((1, N * num_repeat)), next_mask_weights], axis=0
     )
-    for i in range(H):
-        s, a = states[-1], actions[-1]
-        rng1, rng2, key1 = jax.random.split(key1, 3)
-        s_next, rew, terminal, _ = model(rng2, s, jnp.clip(a, -1.0, 1.0))
-        a_next = get_deter(actor(s_next, 0.0))
-        states.append(s_next)
-        actions.append(a_next)
-        rewards.append(rew)
-        masks.append(1 - terminal)
-        mask_weights.append(mask_weights[i] * (1 - terminal))
-        loss_weights.append(loss_weights[i] * (1 - terminal) * discount)
-
-    mask_weights = jnp.stack(mask_weights, axis=0)
-    loss_weights = jnp.stack(loss_weights[:-1], axis=0)
 
     ## Calculate lambda-returns
-    target_q_rollout, lamb_weight = [critic(states[-1], actions[-1])], 1.0
-    for i in reversed(range(H)):
-        q_cur = critic(states[i], actions[i])
-        q_next = (
-            mask_weights[i] * rewards[i]
-            + mask_weights[i + 1] * discount * target_q_rollout[-1]
-        )
-        next_value = (q_cur + lamb * lamb_weight * q_next) / (1 + lamb * lamb_weight)
-        target_q_rollout.append(next_value)
-        lamb_weight = 1.0 + lamb * lamb_weight
-    target_q_rollout = list(reversed(target_q_rollout))[:-1]
-
-    target_q_rollout = jnp.stack(target_q_rollout, axis=0)
-    states = jnp.stack(states[:-1], axis=0)
-    actions = jnp.stack(actions[:-1], axis=0)
-    rewards = jnp.stack(rewards, axis=0)
+    q_values = critic(states, actions)
+    target_q_rollout = lambda_returns(q_values, rewards, mask_weights, discount, lamb)[
+        :-1
+    ]
+
+    ## Back to float32 for the critic losses
+    states = states[:-1].astype(jnp.float32)
+    actions = actions[:-1].astype(jnp.float32)
 
     ## Calculate target for dataset transitions
     next_a = get_deter(actor(data_batch.next_observations, 0.0))
@@ -4,6 +4,7 @@ from typing import Optional, Sequence, Tuple
 
 import jax
 import jax.numpy as jnp
+from jax.sharding import Mesh, NamedSharding, PartitionSpec
 import numpy as np
 import optax
 import gym
@@ -115,7 +116,15 @@ def _update_fqe_jit(
 
 @partial(
     jax.jit,
-    static_argnames=["horizon_length", "num_repeat", "actor_update", "critic_update"],
+    static_argnames=[
+        "discount",
+        "expectile",
+        "lamb",
+        "horizon_length",
+        "num_repeat",
+        "actor_update",
+        "critic_update",
+    ],
 )
 def _update_jit(
     rng: PRNGKey,
@@ -384,6 +393,17 @@ class Learner(object):
         self.target_value = target_value
         self.rng = rng
 
+        ## Rollouts are independent across samples, so on multi-GPU hosts
+        ## shard the batch axis of incoming data; the jitted updates then
+        ## run data-parallel with gradients reduced across devices by XLA.
+        devices = jax.local_devices()
+        if len(devices) > 1:
+            self.mesh = Mesh(np.array(devices), axis_names=("batch",))
+            self.data_sharding = NamedSharding(self.mesh, PartitionSpec("batch"))
+        else:
+            self.mesh = None
+            self.data_sharding = None
+
     def sample_actions(
         self, key: PRNGKey, observations: np.ndarray, temperature: float = 1.0
     ) -> jnp.ndarray:
@@ -408,12 +428,17 @@ class Learner(object):
         return results
 
     def preprocess(self, batch):
+        def _put(x):
+            if self.data_sharding is not None and x.shape[0] % self.mesh.size == 0:
+                return jax.device_put(x, self.data_sharding)
+            return jax.device_put(x)
+
         new_batch = Batch(
-            observations=jax.device_put(batch.observations),
-            actions=jax.device_put(batch.actions),
-            rewards=jax.device_put(batch.rewards),
-            masks=jax.device_put(batch.masks),
-            next_observations=jax.device_put(batch.next_observations),
+            observations=_put(batch.observations),
+            actions=_put(batch.actions),
+            rewards=_put(batch.rewards),
+            masks=_put(batch.masks),
+            next_observations=_put(batch.next_observations),
             returns_to_go=None,
         )
         return new_batch
@@ -4,7 +4,7 @@ import jax
 import jax.numpy as jnp
 
 from common import Batch, InfoDict, Model, Params, PRNGKey
-from common import expectile_loss as loss
+from common import expectile_loss as loss, get_scale
 
 def update_actor(
     key: PRNGKey,
@@ -30,7 +30,7 @@ def update_actor(
 
         actor_loss = -q.mean() + sac_alpha * log_probs.mean()
 
-        policy_std = dist.scale if hasattr(dist, "scale") else dist.distribution.scale
+        policy_std = get_scale(dist)
         return actor_loss, {
             "actor_loss": actor_loss,
             "policy_std": policy_std.mean(),
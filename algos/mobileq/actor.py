@@ -4,7 +4,7 @@ import jax
 import jax.numpy as jnp
 
 from common import Batch, InfoDict, Model, Params, PRNGKey
-from common import expectile_loss as loss, get_deter, get_stoch
+from common import expectile_loss as loss, get_deter, get_scale, get_stoch
 
 sg = lambda x: jax.lax.stop_gradient(x)
 
@@ -75,7 +75,7 @@ def onestep_update_actor(
     def calculate_gae_fwd(Robs, Ra, key0):
         states, actions, mask_weights, keys = [Robs], [Ra], [1.0], [key0]
         for i in range(H):
-            rng1, rng2, rng3, key0 = jax.random.split(keys[-1], 4)
+            rng1, key0 = jax.random.split(keys[-1])
             keys.append(key0)
             s_next, rew, terminal, _ = run_model(rng1, model, states[i], actions[i])
             a_next = get_deter(actor(s_next))
@@ -89,14 +89,15 @@ def onestep_update_actor(
         return states, actions, mask_weights
 
     keys = jax.random.split(key, N * num_repeat)
-    vmap_fwd = lambda func: jax.vmap(func, in_axes=0, out_axes=1)
+    ## Batch-leading outputs avoid the transpose out_axes=1 inserts
+    vmap_fwd = lambda func: jax.vmap(func, in_axes=0, out_axes=0)
     states0, actions0, mask_weights0 = vmap_fwd(calculate_gae_fwd)(Robs, Ra, keys)
 
     def actor_loss_fn(actor_params: Params) -> Tuple[jnp.ndarray, InfoDict]:
         dist = actor.apply({"params": actor_params}, states0)
         actions = get_deter(dist)
         actor_loss = -(mask_weights0 * critic(states0, actions)).mean()
-        policy_std = dist.scale if hasattr(dist, "scale") else dist.distribution.scale
+        policy_std = get_scale(dist)
 
         return actor_loss, {
             "actor_loss": actor_loss,
@@ -135,7 +136,7 @@ def DPG_gae_update_actor(
         states, rewards, actions, mask_weights, keys = [Robs], [], [Ra], [1.0], [key0]
         q_rollout, q_values, ep_weights = [], [critic(Robs, Ra)], []
         for i in range(H):
-            rng1, rng2, rng3, key0 = jax.random.split(keys[-1], 4)
+            rng1, rng3, key0 = jax.random.split(keys[-1], 3)
             keys.append(key0)
             s_next, rew, terminal, _ = run_model(rng1, model, states[i], actions[i])
             a_next = get_deter(actor(s_next))
@@ -166,7 +167,8 @@ def DPG_gae_update_actor(
         return states, actions, mask_weights, q_rollout
 
     keys = jax.random.split(key, N * num_repeat)
-    vmap_fwd = lambda func: jax.vmap(func, in_axes=0, out_axes=1)
+    ## Batch-leading outputs avoid the transpose out_axes=1 inserts
+    vmap_fwd = lambda func: jax.vmap(func, in_axes=0, out_axes=0)
     states0, actions0, mask_weights0, q_rollout = vmap_fwd(calculate_gae_fwd)(
         Robs, Ra, keys
     )
@@ -181,7 +183,7 @@ def DPG_gae_update_actor(
         )
         q_rollout, q_values = [], [critic(Robs, Ra + delta_a[0])]
         for i in range(H):
-            rng1, rng2, rng3, key0 = jax.random.split(keys[-1], 4)
+            rng1, rng3, key0 = jax.random.split(keys[-1], 3)
             keys.append(key0)
             s_next, rew, terminal, _ = run_model(rng1, model, states[i], actions[i])
             a_next = get_deter(actor(s_next)) + delta_a[i + 1]
@@ -209,15 +211,16 @@ def DPG_gae_update_actor(
         return jnp.stack(q_rollout, axis=0)
 
     delta_a = jnp.zeros_like(actions0)
-    vmap_bwd = lambda func: jax.vmap(func, in_axes=(1, 0, 0, 0), out_axes=1)
+    vmap_bwd = lambda func: jax.vmap(func, in_axes=(0, 0, 0, 0), out_axes=0)
     grad_gae = vmap_bwd(jax.jacrev(calculate_gae_bwd))(delta_a, Robs, Ra, keys)
-    grad_gae = jnp.stack([grad_gae[i, :, i] for i in range(H + 1)])
+    ## Take the t == t' block diagonal in one op instead of H+1 python-level gathers
+    grad_gae = jnp.diagonal(grad_gae, axis1=1, axis2=2).transpose(0, 2, 1)
 
     def actor_loss_fn(actor_params: Params) -> Tuple[jnp.ndarray, InfoDict]:
         dist = actor.apply({"params": actor_params}, states0, 1.0, training=True)
         actions_grad = get_deter(dist)
-        policy_std = dist.scale if hasattr(dist, "scale") else dist.distribution.scale
-        actor_loss = -(grad_gae * actions_grad).mean(axis=1).sum()
+        policy_std = get_scale(dist)
+        actor_loss = -(grad_gae * actions_grad).mean(axis=0).sum()
 
         return actor_loss, {
             "actor_loss": actor_loss,
@@ -98,7 +98,7 @@ def onestep_update_q(
     )
     for i in range(H):
         s, a = states[-1], actions[-1]
-        rng1, rng2, rng3, key1 = jax.random.split(key1, 4)
+        rng2, rng3, key1 = jax.random.split(key1, 3)
         s_next, rew, terminal, _ = run_model(rng2, model, s, a)
         a_next = get_deter(actor(s_next, 0.0))
         penalty = get_penalty(rng3, critic, actor, model, states[i], actions[i])
@@ -224,7 +224,7 @@ def lambda_update_q(
     )
     for i in range(H):
         s, a = states[-1], actions[-1]
-        rng1, rng2, rng3, key1 = jax.random.split(key1, 4)
+        rng2, rng3, key1 = jax.random.split(key1, 3)
         s_next, rew, terminal, _ = run_model(rng2, model, s, a)
         a_next = get_deter(actor(s_next, 0.0))
         penalty = get_penalty(rng3, critic, actor, model, states[i], actions[i])
@@ -42,6 +42,53 @@ def symlog(x):
     return jnp.sign(x) * jnp.log1p(jnp.abs(x))
 
 
+def cast_to_bf16(tree):
+    return jax.tree_map(
+        lambda x: x.astype(jnp.bfloat16) if x.dtype == jnp.float32 else x, tree
+    )
+
+
+def lambda_returns(q_values, rewards, mask_weights, discount, lamb):
+    # v_t = (q_t + lamb*w*(m_t*r_t + m_{t+1}*discount*v_{t+1})) / (1 + lamb*w),
+    # carrying w <- 1 + lamb*w, i.e. the closed-form (1 + lamb + lamb^2 + ...)
+    def body(carry, xs):
+        v_next, lamb_weight = carry
+        q_i, rew_i, mask_i, mask_next_i = xs
+        q_next = mask_i * rew_i + mask_next_i * discount * v_next
+        next_value = (q_i + lamb * lamb_weight * q_next) / (1 + lamb * lamb_weight)
+        return (next_value, 1.0 + lamb * lamb_weight), next_value
+
+    _, next_values = jax.lax.scan(
+        body,
+        (q_values[-1], jnp.float32(1.0)),
+        (q_values[:-1], rewards, mask_weights[:-1], mask_weights[1:]),
+        reverse=True,
+    )
+    return jnp.concatenate([next_values, q_values[-1:]], axis=0)
+
+
+def multistep_returns(q_values, rewards, mask_weights, discount):
+    def body(v_next, xs):
+        rew_i, mask_i, mask_next_i = xs
+        q_next = mask_i * rew_i + mask_next_i * discount * v_next
+        return q_next, q_next
+
+    _, next_values = jax.lax.scan(
+        body,
+        q_values[-1],
+        (rewards, mask_weights[:-1], mask_weights[1:]),
+        reverse=True,
+    )
+    return jnp.concatenate([next_values, q_values[-1:]], axis=0)
+
+
+def get_scale(dist):
+    if hasattr(dist, "scale"):
+        return dist.scale
+    else:
+        return dist.distribution.scale
+
+
 def get_deter(dist):
     if hasattr(dist, "scale"):
         return dist.mode()